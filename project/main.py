@@ -2,8 +2,33 @@ from AlgorithmImports import *
 from signal_generator import SignalGenerator
 from order_manager import OrderManager
 from trade_logger import TradeLogger
-import json
-from datetime import timedelta
+from datetime import date
+from collections import namedtuple
+import sys
+
+# Direction codes stored in the per-ticker direction array
+LONG = 1
+SHORT = -1
+SIDE_NAMES = {LONG: 'long', SHORT: 'short'}
+ENTRY_DIRECTIONS = {'entry_long': LONG, 'entry_short': SHORT}  # OrderManager fill type -> direction
+EXIT_REASONS = {'exit_tp': "TakeProfit", 'exit_sl': "StopLoss", 'exit_sl_adjusted': "StopLoss_Adjusted"}  # fill type -> log reason
+
+# Algorithm parameters read in load_parameters
+PARAMETER_NAMES = (
+    'long_entry_offset', 'short_entry_offset', 'tp_percentage', 'sl_percentage',
+    'timestop_days', 'position_size', 'tickers', 'use_cfds', 'capture_point_pct',
+    'breakeven_offset', 'trading_enabled', 'max_daily_loss', 'earnings_dates', 'verbose',
+    'trade_csv', 'trade_logging',
+)
+Params = namedtuple('Params', PARAMETER_NAMES)  # Immutable once load_parameters has run
+
+# Log section separator
+_SEP = "=" * 50
+
+def compute_pnl(direction, entry_price, exit_price, quantity):
+    """Return (pnl, pnl_pct) for a closed position; direction is LONG or SHORT"""
+    delta = direction * (exit_price - entry_price)
+    return delta * quantity, delta / entry_price * 100
 
 class CFDBreakoutStrategy(QCAlgorithm):
     
@@ -21,24 +46,24 @@ class CFDBreakoutStrategy(QCAlgorithm):
         self.load_parameters()
         
         # Initialize components
-        self.signal_generator = SignalGenerator(self.parameters)
+        self.signal_generator = SignalGenerator(self.params)
         self.order_manager = OrderManager(self)
         self.logger = TradeLogger(self)
         
         # Trading state
-        self.daily_open_prices = {}
-        self.bot_positions = {}  # Bot's expected state
-        self.position_metadata = {}  # Store entry times and trading days count
-        self.processed_today = False
-        self.reconciliation_halts = set()
-        self.capture_point_adjusted = {}  # Track which positions had SL adjusted
-        self.last_trading_day = None  # Track trading days
-        self.traded_today = set()  # Track tickers that have traded today
+        self.symbols = {}  # ticker -> Symbol, resolved once in setup_universe
+        self.ticker_by_symbol = {}  # Symbol -> ticker, used by on_order_event
+        self._last_open_ordinal = -1  # Date ordinal of the last trading day capture_market_open ran for
+        self.open_tickers = set()  # Held, unhalted tickers whose SL is not yet at breakeven (drives on_data)
         
         # Risk control state
         self.daily_pnl = 0.0  # Track cumulative daily PnL
         self.daily_loss_limit_hit = False  # Flag when daily loss limit reached
         
+        # Optional trade CSV in the ObjectStore; an unavailable store fails visibly here
+        if self._trade_csv:
+            self.logger.open_trade_csv(self.object_store.get_file_path("trades.csv"))
+        
         # Setup universe
         self.setup_universe()
         
@@ -53,70 +78,105 @@ class CFDBreakoutStrategy(QCAlgorithm):
         
     def load_parameters(self):
         """Load parameters from SetParameter"""
-        self.parameters = {
-            'long_entry_offset': float(self.get_parameter("long_entry_offset") or 0.02),
-            'short_entry_offset': float(self.get_parameter("short_entry_offset") or 0.02),
-            'tp_percentage': float(self.get_parameter("tp_percentage") or 0.05),
-            'sl_percentage': float(self.get_parameter("sl_percentage") or 0.03),
-            'timestop_days': int(self.get_parameter("timestop_days") or 4),
-            'position_size': float(self.get_parameter("position_size") or 10000),  # $ per position
-            'tickers': self.get_parameter("tickers") or "AAPL,MSFT,GOOGL",
-            'use_cfds': self.get_parameter("use_cfds") or "false",
-            'capture_point_pct': float(self.get_parameter("capture_point_pct") or 0.04),  # 4% capture point
-            'breakeven_offset': float(self.get_parameter("breakeven_offset") or 0.01),  # 1% above breakeven
+        # Read every parameter in one pass, then parse from the local dict
+        raw = {name: self.get_parameter(name) for name in PARAMETER_NAMES}
+        self.params = Params(
+            long_entry_offset=float(raw['long_entry_offset'] or 0.02),
+            short_entry_offset=float(raw['short_entry_offset'] or 0.02),
+            tp_percentage=float(raw['tp_percentage'] or 0.05),
+            sl_percentage=float(raw['sl_percentage'] or 0.03),
+            timestop_days=int(raw['timestop_days'] or 4),
+            position_size=float(raw['position_size'] or 10000),  # $ per position
+            tickers=raw['tickers'] or "AAPL,MSFT,GOOGL",
+            use_cfds=raw['use_cfds'] or "false",
+            capture_point_pct=float(raw['capture_point_pct'] or 0.04),  # 4% capture point
+            breakeven_offset=float(raw['breakeven_offset'] or 0.01),  # 1% above breakeven
             # Risk controls
-            'trading_enabled': self.get_parameter("trading_enabled") or "true",  # Kill-switch
-            'max_daily_loss': float(self.get_parameter("max_daily_loss") or 2000),  # $ amount (positive, will be negated)
+            trading_enabled=raw['trading_enabled'] or "true",  # Kill-switch
+            max_daily_loss=float(raw['max_daily_loss'] or 2000),  # $ amount (positive, will be negated)
             # Earnings dates format: "TICKER:YYYY-MM-DD,TICKER:YYYY-MM-DD" (multiple dates per ticker allowed)
-            'earnings_dates': self.get_parameter("earnings_dates") or ""
-        }
+            earnings_dates=raw['earnings_dates'] or "",
+            # Per-ticker debug output (open prices, skip reasons, day counters)
+            verbose=raw['verbose'] or "false",
+            # Stream closed trades to trades.csv in the ObjectStore
+            trade_csv=raw['trade_csv'] or "false",
+            # TradeLogger INFO lines (fills, trades, daily summary); always on in live mode
+            trade_logging=raw['trade_logging'] or "true"
+        )
         
         # Parse earnings dates - support multiple dates per ticker
         self.earnings_calendar = {}
-        if self.parameters['earnings_dates']:
-            for entry in self.parameters['earnings_dates'].split(','):
+        if self.params.earnings_dates:
+            for entry in self.params.earnings_dates.split(','):
                 if ':' in entry:
                     ticker, date_str = entry.split(':')
                     try:
-                        earnings_date = datetime.strptime(date_str.strip(), '%Y-%m-%d')
-                        ticker_clean = ticker.strip()
+                        earnings_date = date.fromisoformat(date_str.strip())
+                        ticker_clean = sys.intern(ticker.strip())
                         if ticker_clean not in self.earnings_calendar:
                             self.earnings_calendar[ticker_clean] = []
                         self.earnings_calendar[ticker_clean].append(earnings_date)
                     except:
                         self.debug(f"Invalid earnings date format: {entry}")
+        
+        # D-2 to D+1 blackout windows as date ordinals, so the daily checks are integer compares
+        self._blackout_ordinals = {
+            t: tuple((d.toordinal() - 2, d.toordinal() + 1) for d in dates)
+            for t, dates in self.earnings_calendar.items()
+        }
+        
+        # Parameters read on hot paths, cached as plain attributes
+        self._timestop_days = self.params.timestop_days
+        self._capture_point_pct = self.params.capture_point_pct
+        self._trading_enabled = self.params.trading_enabled.lower() == "true"
+        self._max_daily_loss = self.params.max_daily_loss
+        self._verbose = self.params.verbose.lower() == "true"
+        self._trade_csv = self.params.trade_csv.lower() == "true"
+        self._trade_logging = self.params.trade_logging.lower() == "true"
             
     def setup_universe(self):
         """Add tickers to universe"""
-        self.tickers = [t.strip() for t in self.parameters['tickers'].split(",")]
-        use_cfds = self.parameters['use_cfds'].lower() == "true"
+        # Interned for identity-fast dict keys; a tuple because every per-ticker array follows this order
+        self.tickers = tuple(sys.intern(t.strip()) for t in self.params.tickers.split(","))
+        self._use_cfds = self.params.use_cfds.strip().lower() == "true"
         
         for ticker in self.tickers:
             # Add symbol based on type
-            if use_cfds:
+            if self._use_cfds:
                 try:
-                    symbol = self.add_cfd(ticker, Resolution.MINUTE)
+                    security = self.add_cfd(ticker, Resolution.MINUTE)
                 except:
-                    symbol = self.add_equity(ticker, Resolution.MINUTE)
+                    security = self.add_equity(ticker, Resolution.MINUTE)
                     self.debug(f"CFD unavailable for {ticker}, using equity")
             else:
-                symbol = self.add_equity(ticker, Resolution.MINUTE)
-            
-            # Initialize tracking
-            self.bot_positions[ticker] = {
-                'has_position': False,
-                'is_entry_pending': False,  # OCO orders placed
-                'entry_price': None,
-                'entry_time': None,
-                'direction': None  # 'long' or 'short'
-            }
+                security = self.add_equity(ticker, Resolution.MINUTE)
             
-            self.position_metadata[ticker] = {
-                'entry_time': None,
-                'trading_days_held': 0  # Track trading days since entry
-            }
+            # Cache the Symbol so callbacks never re-resolve the ticker string
+            self.symbols[ticker] = security.symbol
+            self.ticker_by_symbol[security.symbol] = ticker
+            self.order_manager.register_symbol(security.symbol, ticker, security.symbol_properties.minimum_price_variation)
             
-            self.capture_point_adjusted[ticker] = False
+        # Bot's expected state as one array per field, indexed by self.idx[ticker]
+        n = len(self.tickers)
+        self.idx = {t: i for i, t in enumerate(self.tickers)}
+        
+        # Index-aligned Symbol/Security tuples for the per-day gathers (no dict lookups)
+        self._symbol_list = tuple(self.symbols[t] for t in self.tickers)
+        self._security_list = tuple(self.securities[s] for s in self._symbol_list)
+        self.has_position = np.zeros(n, dtype=np.bool_)
+        self.is_entry_pending = np.zeros(n, dtype=np.bool_)  # OCO orders placed
+        self.entry_price = np.zeros(n, dtype=np.float64)
+        self.expected_qty = np.zeros(n, dtype=np.float64)  # Signed quantity the broker should hold
+        self.capture_target = np.zeros(n, dtype=np.float64)  # Price that moves the SL to breakeven
+        self.direction = np.zeros(n, dtype=np.int8)  # LONG, SHORT or 0 when flat
+        self.entry_time = np.full(n, None, dtype=object)
+        self.days_held = np.zeros(n, dtype=np.int32)  # Trading days since entry
+        self.capture_point_adjusted = np.zeros(n, dtype=np.bool_)  # SL already moved to breakeven
+        self.halted = np.zeros(n, dtype=np.bool_)  # Halted by reconciliation (manual intervention)
+        self.traded_today = np.zeros(n, dtype=np.bool_)  # Entered or exited today - blocks re-entry
+        self._broker_qty = np.zeros(n, dtype=np.float64)  # Scratch buffer for reconcile_positions
+        self._opens = np.zeros(n, dtype=np.float64)  # Scratch buffer for capture_market_open
+        self.signal_generator.reserve(n)
             
         self.debug(f"Universe: {len(self.tickers)} symbols")
             
@@ -125,7 +185,7 @@ class CFDBreakoutStrategy(QCAlgorithm):
         if not self.tickers:
             return
             
-        schedule_symbol = self.symbol(self.tickers[0])
+        schedule_symbol = self.symbols[self.tickers[0]]
         
         # Market open - capture price and place orders
         self.schedule.on(
@@ -143,50 +203,43 @@ class CFDBreakoutStrategy(QCAlgorithm):
         
         self.debug("Scheduling configured")
         
-    def is_in_earnings_blackout(self, ticker):
-        """Check if ticker is in earnings blackout period (D-2 to D+1) for ANY earnings date"""
-        if ticker not in self.earnings_calendar:
+    def is_in_earnings_blackout(self, ticker, today=None):
+        """Check if ticker is in earnings blackout period (D-2 to D+1) for ANY earnings date.
+        today is the current date ordinal; callers that already hold it pass it in."""
+        windows = self._blackout_ordinals.get(ticker)
+        if not windows:
             return False
         
-        current_date = self.time.date()
-        
-        # Check all earnings dates for this ticker
-        for earnings_date in self.earnings_calendar[ticker]:
-            earnings_date_only = earnings_date.date()
-            
-            # D-2 to D+1 blackout window
-            blackout_start = earnings_date_only - timedelta(days=2)
-            blackout_end = earnings_date_only + timedelta(days=1)
-            
-            if blackout_start <= current_date <= blackout_end:
+        if today is None:
+            today = self.time.toordinal()
+        for blackout_start, blackout_end in windows:
+            if blackout_start <= today <= blackout_end:
                 return True
         
         return False
     
     def check_kill_switch(self):
         """Check if trading is enabled (kill-switch)"""
-        enabled = self.parameters['trading_enabled'].lower() == "true"
-        if not enabled:
+        if not self._trading_enabled:
             self.debug("KILL-SWITCH ACTIVE - Trading disabled")
-        return enabled
+        return self._trading_enabled
     
     def check_daily_loss_limit(self):
         """Check if daily loss limit has been exceeded"""
-        max_loss = self.parameters['max_daily_loss']  # Positive value like 2000
+        max_loss = self._max_daily_loss  # Positive value like 2000
 
         if self.daily_pnl <= -max_loss:  # Compare against negative of parameter
             if not self.daily_loss_limit_hit:
-                self.debug("="*50)
+                self.debug(_SEP)
                 self.debug(f"DAILY LOSS LIMIT HIT: ${self.daily_pnl:.2f} <= $-{max_loss:.2f}")
                 self.debug("Halting new trades and canceling all open orders")
-                self.debug("="*50)
+                self.debug(_SEP)
                 self.daily_loss_limit_hit = True
                 
                 # Cancel all open orders across all tickers
                 for ticker in self.tickers:
                     self.order_manager.cleanup_ticker(ticker)
-                    if self.bot_positions[ticker]['is_entry_pending']:
-                        self.bot_positions[ticker]['is_entry_pending'] = False
+                self.is_entry_pending[:] = False
             
             return False  # Don't allow new trades
         
@@ -195,333 +248,349 @@ class CFDBreakoutStrategy(QCAlgorithm):
     def reconcile_positions(self, ticker=None, is_startup=False):
         """Reconcile bot state with broker positions"""
         if is_startup:
-            self.debug("="*50)
+            self.debug(_SEP)
             self.debug("Startup reconciliation")
             
-        tickers_to_check = [ticker] if ticker else self.tickers
-        all_reconciled = True
-        
-        for t in tickers_to_check:
-            if not is_startup and t in self.reconciliation_halts:
-                all_reconciled = False
-                continue
+            for t in ([ticker] if ticker else self.tickers):
+                i = self.idx[t]
+                broker_position = self.portfolio[self._symbol_list[i]]
                 
-            symbol = self.symbol(t)
-            broker_position = self.portfolio[symbol]
-            
-            if is_startup:
                 # On startup, sync with broker
                 if broker_position.invested:
-                    self.bot_positions[t]['has_position'] = True
-                    self.bot_positions[t]['entry_price'] = broker_position.average_price
-                    self.bot_positions[t]['direction'] = 'long' if broker_position.quantity > 0 else 'short'
+                    self.has_position[i] = True
+                    self.entry_price[i] = broker_position.average_price
+                    self.expected_qty[i] = broker_position.quantity
+                    self.direction[i] = LONG if broker_position.quantity > 0 else SHORT
+                    self.capture_target[i] = broker_position.average_price * (1 + self.direction[i] * self._capture_point_pct)
+                    
+                    self.debug(f"Found existing position: {t} {SIDE_NAMES[self.direction[i]]} @ ${broker_position.average_price:.2f}")
                     
                     # For paper/live trading, use current time as we can't recover entry time
                     # In production, you'd store this in a database or file
-                    self.position_metadata[t]['entry_time'] = self.time
-                    self.position_metadata[t]['trading_days_held'] = 0
-                    self.debug(f"Found existing position: {t} {self.bot_positions[t]['direction']} @ ${broker_position.average_price:.2f}")
+                    self.entry_time[i] = self.time
+                    self.days_held[i] = 0
                     self.debug(f"WARNING: Cannot recover entry time for {t}, using current time (time-stop may be inaccurate)")
+                    self.open_tickers.add(t)
                 else:
-                    self.bot_positions[t]['has_position'] = False
-            else:
-                # Runtime check - detect manual intervention
-                bot_has_position = self.bot_positions[t]['has_position']
-                broker_has_position = broker_position.invested
-                
-                if bot_has_position != broker_has_position:
-                    self.debug(f"Mismatch {t}: bot thinks {bot_has_position}, broker has {broker_has_position}")
-                    self.debug(f"Halting {t} - manual intervention detected")
-                    self.reconciliation_halts.add(t)
-                    
-                    # Log manual override
-                    self.logger.log_trade(t, "OVERRIDE", 0, 0, 0, "ManualIntervention")
+                    self.has_position[i] = False
+                    self.expected_qty[i] = 0.0
+                    self.open_tickers.discard(t)
                     
-                    # Sync state and cancel orders
-                    self.bot_positions[t]['has_position'] = broker_has_position
-                    self.transactions.cancel_open_orders(symbol)
-                    self.order_manager.cleanup_ticker(t)
-                    all_reconciled = False
-                    
-        if is_startup:
             self.debug("Reconciliation complete")
+            return True
+            
+        # Runtime check - detect manual intervention. The portfolio reads are
+        # per ticker; the comparison against bot state is one vectorized pass
+        self._broker_qty[:] = [self.portfolio[s].quantity for s in self._symbol_list]
+            
+        mismatch_idx = np.flatnonzero((np.abs(self._broker_qty - self.expected_qty) > 0.01) & ~self.halted)
+        
+        if ticker:
+            mismatch_idx = mismatch_idx[mismatch_idx == self.idx[ticker]]
+            all_reconciled = not self.halted[self.idx[ticker]]
+        else:
+            all_reconciled = not self.halted.any()
+            
+        for i in mismatch_idx:
+            t = self.tickers[i]
+            broker_qty = float(self._broker_qty[i])
+            broker_has_position = broker_qty != 0
+            
+            self.debug(f"Mismatch {t}: bot expects {self.expected_qty[i]:g}, broker has {broker_qty:g}")
+            self.debug(f"Halting {t} - manual intervention detected")
+            self.halted[i] = True
+            
+            # Log manual override
+            self.logger.log_trade(t, "OVERRIDE", 0, 0, 0, "ManualIntervention")
+            
+            # Sync state and cancel orders
+            self.has_position[i] = broker_has_position
+            self.expected_qty[i] = broker_qty
+            self.open_tickers.discard(t)  # Halted tickers are no longer monitored
+            self.transactions.cancel_open_orders(self._symbol_list[i])
+            self.order_manager.cleanup_ticker(t)
+            all_reconciled = False
             
         return all_reconciled
         
     def capture_market_open(self):
         """Capture opening price and place OCO orders"""
-        if self.processed_today:
+        now = self.time
+        today = now.toordinal()
+        if today == self._last_open_ordinal:
             return
-            
-        self.debug("="*50)
-        self.debug(f"Market open at {self.time}")
+        self._last_open_ordinal = today
         
-        # Track that we have a new trading day
-        current_day = self.time.date()
-        if self.last_trading_day != current_day:
-            self.last_trading_day = current_day
-            
-            # Increment trading days for all positions
-            for ticker in self.tickers:
-                if self.bot_positions[ticker]['has_position']:
-                    self.position_metadata[ticker]['trading_days_held'] += 1
-                    self.debug(f"{ticker} position day counter: D+{self.position_metadata[ticker]['trading_days_held']}")
+        # Lines for each phase are collected and emitted as one debug message
+        msgs = [_SEP, f"Market open at {now}"]
+        
+        # The ordinal guard above already admits each trading day once, so
+        # the day counters advance unconditionally here
+        self.days_held += self.has_position
+        if self._verbose:
+            for i in np.flatnonzero(self.has_position):
+                msgs.append(f"{self.tickers[i]} position day counter: D+{self.days_held[i]}")
+        self.debug("\n".join(msgs))
         
         # Check for overnight manual interventions
         self.reconcile_positions(is_startup=False)
         
         # First, check for D+4 time-stops (these update daily_pnl)
-        self.process_timestops()
+        self.process_timestops(today)
         
         # Check kill-switch
         if not self.check_kill_switch():
             self.debug("Kill-switch active - skipping all new entries")
-            self.processed_today = True
             return
         
         # Check daily loss limit (after timestops might have triggered)
         if not self.check_daily_loss_limit():
             self.debug(f"Daily loss limit exceeded (${self.daily_pnl:.2f}) - skipping all new entries")
-            self.processed_today = True
             return
         
-        self.daily_open_prices = {}
-        
-        for ticker in self.tickers:
+        # Gather opening prices, then compute every entry level in one vectorized pass
+        self._opens[:] = [security.open for security in self._security_list]
+        long_stops, short_stops, valid = self.signal_generator.generate_entry_levels(self._opens)
+        
+        # Loop invariants bound once; levels converted to Python floats in one call each
+        opens, long_stops, short_stops = self._opens.tolist(), long_stops.tolist(), short_stops.tolist()
+        valid_flags = valid.tolist()
+        build_signals = self.signal_generator.build_signals
+        halted, has_position, is_entry_pending = self.halted, self.has_position, self.is_entry_pending
+        traded_today = self.traded_today
+        verbose = self._verbose
+        msgs = []
+        log = msgs.append
+        
+        # Gather phase: eligible tickers and their signals; orders go out together below
+        batch_idx, batch = [], []
+        
+        if verbose:
+            # Visit every ticker so each skip reason is reported
+            visit = range(len(self.tickers))
+        else:
+            # Only missing opens (always warned about) and tickers the array
+            # state leaves eligible for entry have anything to do below
+            visit = np.flatnonzero(~halted & ((self._opens <= 0) | (
+                valid & ~traded_today & ~has_position & ~is_entry_pending))).tolist()
+        
+        tickers = self.tickers
+        for i in visit:
+            ticker = tickers[i]
             # Skip halted tickers
-            if ticker in self.reconciliation_halts:
-                self.debug(f"{ticker} halted")
+            if halted[i]:
+                if verbose:
+                    log(f"{ticker} halted")
                 continue
-                
-            symbol = self.symbol(ticker)
             
             # Get opening price
-            if self.securities[symbol].open > 0:
-                open_price = self.securities[symbol].open
-                self.daily_open_prices[ticker] = open_price
-                
-                self.debug(f"{ticker} open: ${open_price:.2f}")
+            open_price = opens[i]
+            if open_price > 0:
+                if verbose:
+                    log(f"{ticker} open: ${open_price:.2f}")
                 
                 # Check if ticker already traded today
-                if ticker in self.traded_today:
-                    self.debug(f"  {ticker} already traded today - no new entries")
+                if traded_today[i]:
+                    if verbose:
+                        log(f"  {ticker} already traded today - no new entries")
                     continue
                 
                 # Check earnings blackout for new entries
-                if self.is_in_earnings_blackout(ticker):
-                    self.debug(f"  {ticker} in earnings blackout - no new trades")
+                if self.is_in_earnings_blackout(ticker, today):
+                    if verbose:
+                        log(f"  {ticker} in earnings blackout - no new trades")
                     continue
                 
                 # Only place orders if no position and no pending orders
-                if not self.bot_positions[ticker]['has_position'] and not self.bot_positions[ticker]['is_entry_pending']:
-                    # Generate and place OCO orders
-                    signals = self.signal_generator.generate_entry_signals(ticker, open_price)
+                if not has_position[i] and not is_entry_pending[i]:
+                    signals = build_signals(ticker, open_price, long_stops[i], short_stops[i]) if valid_flags[i] else None
                     if signals:
-                        signals['position_size'] = self.parameters['position_size']
-                        if self.order_manager.place_oco_orders(symbol, signals):
-                            self.bot_positions[ticker]['is_entry_pending'] = True
-                            self.debug(f"  OCO orders placed for {ticker}")
-                else:
-                    if self.bot_positions[ticker]['has_position']:
-                        self.debug(f"  {ticker} has position - skipping")
-                    elif self.bot_positions[ticker]['is_entry_pending']:
-                        self.debug(f"  {ticker} has pending OCO - skipping")
+                        batch_idx.append(i)
+                        batch.append((self._symbol_list[i], signals))
+                elif verbose:
+                    if has_position[i]:
+                        log(f"  {ticker} has position - skipping")
+                    elif is_entry_pending[i]:
+                        log(f"  {ticker} has pending OCO - skipping")
             else:
-                self.debug(f"Warning: No opening price for {ticker}")
-                
-        self.processed_today = True
-        
-    def process_timestops(self):
-        """Process D+4 time-stop exits at market open"""
-        for ticker in self.tickers:
-            if ticker in self.reconciliation_halts:
-                continue
-                
-            if not self.bot_positions[ticker]['has_position']:
+                log(f"Warning: No opening price for {ticker}")
+        
+        # Submit phase: place every OCO pair in one pass
+        if batch:
+            placed = self.order_manager.place_oco_orders_batch(batch)
+            for i, ok in zip(batch_idx, placed):
+                if ok:
+                    is_entry_pending[i] = True
+                    if verbose:
+                        log(f"  OCO orders placed for {self.tickers[i]}")
+        
+        if msgs:
+            self.debug("\n".join(msgs))
+        
+    def process_timestops(self, today):
+        """Process D+4 time-stop exits at market open; today is the date ordinal"""
+        # Held, unhalted positions at or past the time-stop (D+4 means 4 trading days after entry)
+        due = self.has_position & (self.days_held >= self._timestop_days) & ~self.halted
+        for i in np.flatnonzero(due):
+            ticker = self.tickers[i]
+            trading_days_held = int(self.days_held[i])
+            
+            # Check if in earnings blackout - no timestops during earnings
+            if self.is_in_earnings_blackout(ticker, today):
+                self.debug(f"{ticker} D+{trading_days_held} timestop blocked by earnings blackout")
                 continue
                 
-            # Get trading days held
-            trading_days_held = self.position_metadata[ticker]['trading_days_held']
+            # Execute time-stop
+            symbol = self._symbol_list[i]
             
-            # Check if time-stop should trigger (D+4 means 4 trading days after entry)
-            if trading_days_held >= self.parameters['timestop_days']:
-                # Check if in earnings blackout - no timestops during earnings
-                if self.is_in_earnings_blackout(ticker):
-                    self.debug(f"{ticker} D+{trading_days_held} timestop blocked by earnings blackout")
-                    continue
-                    
-                # Execute time-stop
-                symbol = self.symbol(ticker)
-                
-                # Cancel any existing bracket orders
-                self.order_manager.cleanup_ticker(ticker)
-                
-                # Get position details before liquidation
-                position = self.portfolio[symbol]
-                entry_price = self.bot_positions[ticker]['entry_price']
-                direction = self.bot_positions[ticker]['direction']
-                quantity = abs(position.quantity)
-                
-                # Liquidate position and get the order tickets
-                liquidate_tickets = self.liquidate(symbol, tag="TimeStop_D+4")
-                
-                # Get exit price from liquidation or use current price
-                exit_price = self.securities[symbol].price
-                
-                # For immediate fills in backtest, use the current price
-                # In live trading, you'd wait for the fill
-                if self.securities[symbol].open > 0:
-                    exit_price = self.securities[symbol].open
-                
-                # Calculate PnL correctly
-                if direction == 'long':
-                    pnl = (exit_price - entry_price) * quantity
-                    pnl_pct = ((exit_price - entry_price) / entry_price) * 100
-                else:
-                    pnl = (entry_price - exit_price) * quantity
-                    pnl_pct = ((entry_price - exit_price) / entry_price) * 100
-                
-                # Update daily PnL
-                self.daily_pnl += pnl
+            # Cancel any existing bracket orders
+            self.order_manager.cleanup_ticker(ticker)
+            
+            # Get position details before liquidation
+            position = self.portfolio[symbol]
+            entry_price = float(self.entry_price[i])
+            direction = SIDE_NAMES[self.direction[i]]
+            quantity = abs(position.quantity)
+            
+            # Close with a single market order for the known quantity
+            self.market_order(symbol, -position.quantity, tag="TimeStop_D+4")
+            
+            # Get exit price from liquidation or use current price
+            security = self._security_list[i]
+            exit_price = security.price
+            
+            # For immediate fills in backtest, use the current price
+            # In live trading, you'd wait for the fill
+            if security.open > 0:
+                exit_price = security.open
+            
+            # Calculate PnL
+            pnl, pnl_pct = compute_pnl(int(self.direction[i]), entry_price, exit_price, quantity)
+            
+            # Update daily PnL
+            self.daily_pnl += pnl
 
-                self.debug(f"TimeStop executed: {ticker} @ ${exit_price:.2f} (D+{trading_days_held}, {pnl_pct:+.2f}%, Daily PnL: ${self.daily_pnl:.2f})")
+            self.debug(f"TimeStop executed: {ticker} @ ${exit_price:.2f} (D+{trading_days_held}, {pnl_pct:+.2f}%, Daily PnL: ${self.daily_pnl:.2f})")
 
-                # Check if daily loss limit exceeded after timestop
-                self.check_daily_loss_limit()
+            # Check if daily loss limit exceeded after timestop
+            self.check_daily_loss_limit()
 
-                # Log the trade with correct PnL
-                self.logger.log_trade(ticker, direction, entry_price, exit_price, pnl, "TimeStop")
-                
-                # Mark ticker as traded today - PREVENT RE-ENTRY
-                self.traded_today.add(ticker)
-                
-                # Reset position state
-                self.bot_positions[ticker]['has_position'] = False
-                self.bot_positions[ticker]['entry_price'] = None
-                self.bot_positions[ticker]['entry_time'] = None
-                self.bot_positions[ticker]['direction'] = None
-                self.position_metadata[ticker]['entry_time'] = None
-                self.position_metadata[ticker]['trading_days_held'] = 0
-                self.capture_point_adjusted[ticker] = False
+            # Log the trade with correct PnL
+            self.logger.log_trade(ticker, direction, entry_price, exit_price, pnl, "TimeStop")
+            
+            # Mark ticker as traded today - PREVENT RE-ENTRY
+            self.traded_today[i] = True
+            
+            # Reset position state
+            self._reset_position_state(i)
+    
+    def _reset_position_state(self, i):
+        """Clear every per-ticker position field after a close"""
+        self.has_position[i] = False
+        self.entry_price[i] = 0.0
+        self.capture_target[i] = 0.0
+        self.expected_qty[i] = 0.0
+        self.entry_time[i] = None
+        self.direction[i] = 0
+        self.days_held[i] = 0
+        self.capture_point_adjusted[i] = False
+        self.open_tickers.discard(self.tickers[i])
     
     def on_data(self, data):
         """Monitor positions for capture-point SL adjustment"""
-        for ticker in self.tickers:
-            # Skip if halted or no position
-            if ticker in self.reconciliation_halts:
-                continue
-                
-            pos = self.bot_positions[ticker]
-            if not pos['has_position'] or not pos['entry_price']:
-                continue
-                
-            # Skip if already adjusted
-            if self.capture_point_adjusted[ticker]:
+        # Market open is handled by the scheduled capture_market_open; with
+        # nothing held there is no per-bar work to do
+        if not self.open_tickers:
+            return
+        
+        # Only held tickers awaiting the capture point are in the set; copy it
+        # since a successful adjustment removes the ticker
+        for ticker in tuple(self.open_tickers):
+            i = self.idx[ticker]
+            if not self.entry_price[i]:
                 continue
                 
-            symbol = self.symbol(ticker)
-            current_price = self.securities[symbol].price
+            current_price = self._security_list[i].price
             
             if current_price <= 0:
                 continue
-                
-            entry_price = pos['entry_price']
-            capture_point_pct = self.parameters['capture_point_pct']
             
-            # Check if capture point reached
-            capture_point_hit = False
-            if pos['direction'] == 'long':
-                capture_target = entry_price * (1 + capture_point_pct)
-                if current_price >= capture_target:
-                    capture_point_hit = True
-                    self.debug(f"{ticker} long capture point hit: ${current_price:.2f} >= ${capture_target:.2f}")
-            else:  # short
-                capture_target = entry_price * (1 - capture_point_pct)
-                if current_price <= capture_target:
-                    capture_point_hit = True
-                    self.debug(f"{ticker} short capture point hit: ${current_price:.2f} <= ${capture_target:.2f}")
+            # Target was fixed at entry; direction (+1/-1) folds the long/short compare into one
+            direction = int(self.direction[i])
+            capture_target = float(self.capture_target[i])
+            capture_point_hit = direction * (current_price - capture_target) >= 0
+            if capture_point_hit and self._verbose:
+                self.debug(f"{ticker} {SIDE_NAMES[direction]} capture point hit: ${current_price:.2f} {'>=' if direction == LONG else '<='} ${capture_target:.2f}")
             
             # Adjust stop-loss to breakeven + offset
             if capture_point_hit:
-                if self.order_manager.adjust_sl_to_breakeven(symbol, ticker, entry_price, pos['direction']):
-                    self.capture_point_adjusted[ticker] = True
+                if self.order_manager.adjust_sl_to_breakeven(self._symbol_list[i], ticker, float(self.entry_price[i]), SIDE_NAMES[direction]):
+                    self.capture_point_adjusted[i] = True
+                    self.open_tickers.discard(ticker)
         
     def on_order_event(self, order_event):
         """Handle order events - coordinate with order manager"""
-        # More robust symbol parsing for paper/live trading
-        symbol_str = str(order_event.symbol)
-        if ' ' in symbol_str:
-            ticker = symbol_str.split(' ')[0]
-        else:
-            # Handle cases where symbol doesn't have space
-            ticker = symbol_str.replace('CFD', '').replace('EQUITY', '').strip()
+        # Symbol -> ticker map is built in setup_universe (works for CFD and equity symbols)
+        ticker = self.ticker_by_symbol.get(order_event.symbol)
+        if ticker is None:
+            return
         
         # Let order manager process OCO and bracket logic
         fill_type = self.order_manager.handle_order_event(order_event)
         
         # Update bot state based on what happened
-        if order_event.status == OrderStatus.FILLED and fill_type:
+        i = self.idx[ticker]
+        status = order_event.status
+        if status == OrderStatus.FILLED and fill_type:
             
             # Don't update if ticker is halted
-            if ticker in self.reconciliation_halts:
+            if self.halted[i]:
                 self.debug(f"Ignoring fill for halted ticker {ticker}")
                 return
                 
-            if fill_type == 'entry_long':
-                self.bot_positions[ticker]['has_position'] = True
-                self.bot_positions[ticker]['is_entry_pending'] = False
-                self.bot_positions[ticker]['direction'] = 'long'
-                self.bot_positions[ticker]['entry_price'] = order_event.fill_price
-                self.bot_positions[ticker]['entry_time'] = self.time
-                self.position_metadata[ticker]['entry_time'] = self.time
-                self.position_metadata[ticker]['trading_days_held'] = 0  # Reset counter
-                self.capture_point_adjusted[ticker] = False
+            if fill_type in ENTRY_DIRECTIONS:
+                direction = ENTRY_DIRECTIONS[fill_type]
+                fill_price = order_event.fill_price
+                now = self.time
+                self.has_position[i] = True
+                self.is_entry_pending[i] = False
+                self.direction[i] = direction
+                self.entry_price[i] = fill_price
+                self.capture_target[i] = fill_price * (1 + direction * self._capture_point_pct)
+                # Full bracketed size from the OCO record - fill_quantity is only this
+                # event's piece when an entry fills in several parts
+                self.expected_qty[i] = direction * self.order_manager.order_info[order_event.order_id]['quantity']
+                self.entry_time[i] = now
+                self.days_held[i] = 0  # Reset counter
+                self.capture_point_adjusted[i] = False
                 
                 # Mark ticker as traded today
-                self.traded_today.add(ticker)
-                
-                self.debug(f"Entry recorded: {ticker} long @ ${order_event.fill_price:.2f}")
+                self.traded_today[i] = True
+                self.open_tickers.add(ticker)
                 
-            elif fill_type == 'entry_short':
-                self.bot_positions[ticker]['has_position'] = True
-                self.bot_positions[ticker]['is_entry_pending'] = False
-                self.bot_positions[ticker]['direction'] = 'short'
-                self.bot_positions[ticker]['entry_price'] = order_event.fill_price
-                self.bot_positions[ticker]['entry_time'] = self.time
-                self.position_metadata[ticker]['entry_time'] = self.time
-                self.position_metadata[ticker]['trading_days_held'] = 0  # Reset counter
-                self.capture_point_adjusted[ticker] = False
+                self.debug(f"Entry recorded: {ticker} {SIDE_NAMES[direction]} @ ${fill_price:.2f}")
                 
-                # Mark ticker as traded today
-                self.traded_today.add(ticker)
-                
-                self.debug(f"Entry recorded: {ticker} short @ ${order_event.fill_price:.2f}")
+            elif fill_type in EXIT_REASONS and not self.has_position[i]:
+                # Second bracket leg filled before its cancel landed - the position
+                # is now flipped, so let reconciliation halt and clean up at once
+                self.debug(f"WARNING: {ticker} {EXIT_REASONS[fill_type]} filled with no open position")
+                self.reconcile_positions(ticker)
                 
-            elif fill_type in ['exit_tp', 'exit_sl', 'exit_sl_adjusted']:
+            elif fill_type in EXIT_REASONS:
                 # Position closed
-                entry_price = self.bot_positions[ticker]['entry_price']
+                exit_reason = EXIT_REASONS[fill_type]
+                entry_price = float(self.entry_price[i])
                 exit_price = order_event.fill_price
-                direction = self.bot_positions[ticker]['direction']
+                direction_code = int(self.direction[i])
+                direction = SIDE_NAMES[direction_code]
                 
                 # Calculate PnL
-                if direction == 'long':
-                    pnl = (exit_price - entry_price) * abs(order_event.fill_quantity)
-                    pnl_pct = ((exit_price - entry_price) / entry_price) * 100
-                else:
-                    pnl = (entry_price - exit_price) * abs(order_event.fill_quantity)
-                    pnl_pct = ((entry_price - exit_price) / entry_price) * 100
+                # A closing fill is signed against the position, so -direction * fill_quantity is the size closed
+                pnl, pnl_pct = compute_pnl(direction_code, entry_price, exit_price, -direction_code * order_event.fill_quantity)
                 
                 # Update daily PnL
                 self.daily_pnl += pnl
 
-                # Determine exit reason
-                if fill_type == 'exit_tp':
-                    exit_reason = "TakeProfit"
-                elif fill_type == 'exit_sl_adjusted':
-                    exit_reason = "StopLoss_Adjusted"
-                else:
-                    exit_reason = "StopLoss"
-
                 self.debug(f"Exit recorded: {ticker} @ ${exit_price:.2f} ({exit_reason}, {pnl_pct:+.2f}%, Daily PnL: ${self.daily_pnl:.2f})")
 
                 # Check if daily loss limit exceeded after exit
@@ -531,69 +600,80 @@ class CFDBreakoutStrategy(QCAlgorithm):
                 self.logger.log_trade(ticker, direction, entry_price, exit_price, pnl, exit_reason)
                 
                 # Mark ticker as traded today - PREVENT RE-ENTRY
-                self.traded_today.add(ticker)
+                self.traded_today[i] = True
                 
                 # Reset position state
-                self.bot_positions[ticker]['has_position'] = False
-                self.bot_positions[ticker]['entry_price'] = None
-                self.bot_positions[ticker]['entry_time'] = None
-                self.bot_positions[ticker]['direction'] = None
-                self.position_metadata[ticker]['entry_time'] = None
-                self.position_metadata[ticker]['trading_days_held'] = 0
-                self.capture_point_adjusted[ticker] = False
+                self._reset_position_state(i)
+                
+        elif status == OrderStatus.PARTIALLY_FILLED:
+            # A bracket exit filling in pieces shrinks the position before its final
+            # FILLED event; track it so reconciliation doesn't read it as an intervention
+            if not self.halted[i] and self.order_manager.is_bracket_order(order_event.order_id):
+                self.expected_qty[i] += order_event.fill_quantity
                 
-        elif order_event.status == OrderStatus.CANCELED:
+        elif status == OrderStatus.CANCELED:
             # Handle OCO cancellation
-            if ticker in self.bot_positions and self.bot_positions[ticker]['is_entry_pending']:
+            if self.is_entry_pending[i]:
                 # Check if all OCO orders are now canceled
                 if not self.order_manager.has_pending_oco(ticker):
-                    self.bot_positions[ticker]['is_entry_pending'] = False
+                    self.is_entry_pending[i] = False
                     
         self.logger.log_order_event(order_event)
         
     def end_of_day_processing(self):
         """End of day cleanup"""
-        self.processed_today = False
+        now = self.time
         
-        # Cancel any unfilled OCO orders
-        for ticker in self.tickers:
-            if self.bot_positions[ticker]['is_entry_pending']:
-                symbol = self.symbol(ticker)
-                self.order_manager.cancel_oco_orders(ticker)
-                self.bot_positions[ticker]['is_entry_pending'] = False
+        # Cancel any unfilled OCO orders - visit only the pending tickers
+        for i in np.flatnonzero(self.is_entry_pending):
+            ticker = self.tickers[i]
+            self.order_manager.cancel_oco_orders(ticker)
+            if self._verbose:
                 self.debug(f"Canceled unfilled OCO orders for {ticker}")
+        self.is_entry_pending[:] = False
                 
-        if self.reconciliation_halts:
-            self.debug(f"Halted tickers: {self.reconciliation_halts}")
+        if self.halted.any():
+            self.debug(f"Halted tickers: {[self.tickers[i] for i in np.flatnonzero(self.halted)]}")
             
-        # Clear traded today set for next trading day
-        if self.traded_today:
-            self.debug(f"Traded today (blocked re-entry): {self.traded_today}")
-        self.traded_today.clear()
+        # Clear traded-today flags for next trading day
+        if self._verbose and self.traded_today.any():
+            self.debug(f"Traded today (blocked re-entry): {[self.tickers[i] for i in np.flatnonzero(self.traded_today)]}")
+        self.traded_today[:] = False
         
         # Daily summary (includes daily PnL)
-        self.logger.daily_summary(self.time, self.daily_pnl)
+        self.logger.daily_summary(now)
         
         # Reset daily PnL and loss limit flag for next day
         self.daily_pnl = 0.0
         self.daily_loss_limit_hit = False
         
+    def on_end_of_algorithm(self):
+        """Emit any log lines still buffered by the trade logger and close the trade CSV"""
+        self.logger.flush()
+        self.logger.close_trade_csv()
+        
     def setup_logging(self):
-        """Initial logging"""
-        self.debug("="*50)
-        self.debug("CFD BREAKOUT STRATEGY")
-        self.debug(f"Long offset: +{self.parameters['long_entry_offset']*100:.1f}%")
-        self.debug(f"Short offset: -{self.parameters['short_entry_offset']*100:.1f}%")
-        self.debug(f"TP: {self.parameters['tp_percentage']*100:.1f}%")
-        self.debug(f"SL: {self.parameters['sl_percentage']*100:.1f}%")
-        self.debug(f"Capture point: {self.parameters['capture_point_pct']*100:.1f}%")
-        self.debug(f"Breakeven offset: {self.parameters['breakeven_offset']*100:.1f}%")
-        self.debug(f"Time-stop: D+{self.parameters['timestop_days']}")
-        self.debug(f"Position size: ${self.parameters['position_size']}")
-        self.debug(f"Tickers: {self.parameters['tickers']}")
-        self.debug("--- Risk Controls ---")
-        self.debug(f"Trading enabled: {self.parameters['trading_enabled']}")
-        self.debug(f"Max daily loss: $-{self.parameters['max_daily_loss']}")
+        """Initial logging - one multi-line debug message"""
+        lines = [
+            _SEP,
+            "CFD BREAKOUT STRATEGY",
+            f"Long offset: +{self.params.long_entry_offset*100:.1f}%",
+            f"Short offset: -{self.params.short_entry_offset*100:.1f}%",
+            f"TP: {self.params.tp_percentage*100:.1f}%",
+            f"SL: {self.params.sl_percentage*100:.1f}%",
+            f"Capture point: {self.params.capture_point_pct*100:.1f}%",
+            f"Breakeven offset: {self.params.breakeven_offset*100:.1f}%",
+            f"Time-stop: D+{self.params.timestop_days}",
+            f"Position size: ${self.params.position_size}",
+            f"Tickers: {self.params.tickers}",
+            "--- Risk Controls ---",
+            f"Trading enabled: {self.params.trading_enabled}",
+            f"Max daily loss: $-{self.params.max_daily_loss}",
+            f"Verbose logging: {self.params.verbose}",
+            f"Trade CSV: {self.params.trade_csv}",
+            f"Trade logging: {self.params.trade_logging}"
+        ]
         if self.earnings_calendar:
-            self.debug(f"Earnings dates loaded: {sum(len(dates) for dates in self.earnings_calendar.values())} dates across {len(self.earnings_calendar)} tickers")
-        self.debug("="*50)
+            lines.append(f"Earnings dates loaded: {sum(len(dates) for dates in self.earnings_calendar.values())} dates across {len(self.earnings_calendar)} tickers")
+        lines.append(_SEP)
+        self.debug("\n".join(lines))
\ No newline at end of file
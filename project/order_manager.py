@@ -1,6 +1,39 @@
 # region imports
 from AlgorithmImports import *
 # endregion
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+# Statuses after which an order can no longer be canceled
+TERMINAL_STATUSES = frozenset((OrderStatus.FILLED, OrderStatus.CANCELED, OrderStatus.INVALID))
+
+def make_tick_rounder(tick_size):
+    """
+    Build a rounder for one tick size. The tick is held as an integer count of
+    10**-decimals units so rounding happens on an exact integer grid.
+    """
+    tick = Decimal(str(tick_size)).normalize()
+    scale = 10 ** max(0, -tick.as_tuple().exponent)
+    tick_units = int(tick * scale)
+    # Integer tick count, converted back to float only on return
+    return lambda price: round(price * scale / tick_units) * tick_units / scale
+
+@dataclass(slots=True)
+class OCOPair:
+    """Resting long/short entry pair for one ticker."""
+    long_id: int
+    short_id: int
+    tp_pct: float
+    sl_pct: float
+
+@dataclass(slots=True)
+class BracketSet:
+    """TP/SL exit pair protecting one filled position."""
+    tp_id: int
+    sl_id: int
+    quantity: int  # Size each bracket leg closes
+    sl_adjusted: bool = False  # SL moved to breakeven
 
 class OrderManager:
     """
@@ -8,52 +41,102 @@ class OrderManager:
     Returns fill types to main.py for position tracking.
     """
     
+    __slots__ = ('algo', 'oco_pairs', 'position_brackets', 'order_info', '_orders_by_ticker',
+                 '_rounder_for', '_ticker_of', '_fill_handlers', '_verbose', '_breakeven_offset')
+    
     def __init__(self, algorithm):
         self.algo = algorithm
-        self.oco_pairs = {}  # ticker -> {'long': order_id, 'short': order_id}
-        self.position_brackets = {}  # ticker -> {'tp': order_id, 'sl': order_id, 'entry_price': price, 'sl_adjusted': bool}
+        self.oco_pairs = {}  # ticker -> OCOPair
+        self.position_brackets = {}  # ticker -> BracketSet
         self.order_info = {}  # order_id -> order details
+        self._orders_by_ticker = defaultdict(set)  # ticker -> order_ids in order_info
+        self._rounder_for = {}  # symbol -> tick rounder, filled by register_symbol
+        self._ticker_of = {}  # symbol -> ticker, filled by register_symbol
+        self._verbose = algorithm._verbose  # Gates routine success-path debug lines
+        self._breakeven_offset = algorithm.params.breakeven_offset
+        
+        # order_info 'type' -> fill handler returning the fill type for main.py
+        self._fill_handlers = {
+            'oco_long': self._on_oco_long,
+            'oco_short': self._on_oco_short,
+            'bracket_tp': self._on_tp,
+            'bracket_sl': self._on_sl,
+            'bracket_sl_adjusted': self._on_sl_adjusted
+        }
         
-    def round_to_tick(self, price):
+    def register_symbol(self, symbol, ticker, tick_size):
         """
-        Round price to IBKR minimum tick size.
+        Record a symbol's ticker and minimum price variation at subscription time.
         """
+        self._ticker_of[symbol] = ticker
+        self._rounder_for[symbol] = make_tick_rounder(tick_size)
+        
+    def _ticker(self, symbol):
+        """Ticker for a symbol; unregistered symbols fall back to symbol.value"""
+        ticker = self._ticker_of.get(symbol)
+        if ticker is None:
+            ticker = self._ticker_of[symbol] = symbol.value
+        return ticker
+        
+    def round_to_tick(self, price, symbol=None):
+        """
+        Round price to the symbol's registered tick size, falling back to
+        the IBKR minimum tick for unregistered symbols.
+        """
+        rounder = self._rounder_for.get(symbol)
+        if rounder is not None:
+            return rounder(price)
         if price >= 1.00:
             return round(price, 2)  # $0.01 tick
         else:
             return round(price, 4)  # $0.0001 tick
     
-    def place_oco_orders(self, symbol, signals):
+    def place_oco_orders_batch(self, batch):
         """
-        Place OCO entry orders. Returns True if successful.
+        Place OCO entry orders for several tickers in one pass.
         OCO entries use stop-limit with cushion to avoid chasing.
+        batch is a list of (symbol, signals); returns a list of success flags
+        aligned with it. All prices are resolved before the first order is
+        submitted so the 2N submissions go out back-to-back.
         """
-        ticker = str(symbol).split(' ')[0]
+        prepared = [(symbol, self._prepare_oco(symbol, signals)) for symbol, signals in batch]
+        return [levels is not None and self._submit_oco(symbol, levels) for symbol, levels in prepared]
+    
+    def _prepare_oco(self, symbol, signals):
+        """
+        Resolve tick-rounded OCO prices and quantities without touching the broker.
+        Returns None if the ticker should not get an OCO.
+        """
+        ticker = self._ticker(symbol)
         
         # Check if OCO already exists
         if ticker in self.oco_pairs:
             self.algo.debug(f"OCO already exists for {ticker}")
-            return False
+            return None
             
-        # Get position size
-        position_value = signals.get('position_size', 10000)
+        # Quantities are sized by SignalGenerator
+        long_quantity = signals['long_quantity']
+        short_quantity = signals['short_quantity']
         
+        if long_quantity <= 0 or short_quantity <= 0:
+            self.algo.debug(f"Position size too small for {ticker}")
+            return None
+            
         # Calculate and round prices
-        long_stop = self.round_to_tick(signals['long_stop'])
-        short_stop = self.round_to_tick(signals['short_stop'])
+        long_stop = self.round_to_tick(signals['long_stop'], symbol)
+        short_stop = self.round_to_tick(signals['short_stop'], symbol)
         
         # Add cushion for limit prices (0.1% - this is OK for entries)
-        long_limit = self.round_to_tick(long_stop * 1.001)
-        short_limit = self.round_to_tick(short_stop * 0.999)
-        
-        # Calculate quantities
-        long_quantity = int(position_value / long_stop)
-        short_quantity = int(position_value / short_stop)
+        long_limit = self.round_to_tick(long_stop * 1.001, symbol)
+        short_limit = self.round_to_tick(short_stop * 0.999, symbol)
         
-        if long_quantity <= 0 or short_quantity <= 0:
-            self.algo.debug(f"Position size too small for {ticker}")
-            return False
-            
+        return (ticker, long_quantity, long_stop, long_limit, short_quantity, short_stop, short_limit,
+                signals['tp_percentage'], signals['sl_percentage'])
+    
+    def _submit_oco(self, symbol, levels):
+        """Submit a prepared OCO pair and track it. Returns True if successful."""
+        (ticker, long_quantity, long_stop, long_limit, short_quantity, short_stop, short_limit,
+         tp_pct, sl_pct) = levels
         try:
             # Place long entry order - stop-limit is OK for entries
             long_order = self.algo.stop_limit_order(
@@ -72,27 +155,23 @@ class OrderManager:
             )
             
             # Track OCO pair
-            self.oco_pairs[ticker] = {
-                'long': long_order.order_id,
-                'short': short_order.order_id,
-                'tp_pct': signals['tp_percentage'],
-                'sl_pct': signals['sl_percentage']
-            }
+            self.oco_pairs[ticker] = OCOPair(long_order.order_id, short_order.order_id, tp_pct, sl_pct)
             
             # Track order info
-            self.order_info[long_order.order_id] = {
+            self._add_order(long_order.order_id, {
                 'ticker': ticker,
                 'type': 'oco_long',
                 'quantity': long_quantity
-            }
+            })
             
-            self.order_info[short_order.order_id] = {
+            self._add_order(short_order.order_id, {
                 'ticker': ticker,
                 'type': 'oco_short',
                 'quantity': short_quantity
-            }
+            })
             
-            self.algo.debug(f"OCO placed: Long {long_quantity}@${long_stop:.2f}, Short {short_quantity}@${short_stop:.2f}")
+            if self._verbose:
+                self.algo.debug(f"OCO placed: Long {long_quantity}@${long_stop:.2f}, Short {short_quantity}@${short_stop:.2f}")
             return True
             
         except Exception as e:
@@ -105,59 +184,45 @@ class OrderManager:
         TP uses limit order (want specific price).
         SL uses STOP-MARKET order (exit immediately when triggered).
         """
-        ticker = str(symbol).split(' ')[0]
+        ticker = self._ticker(symbol)
         
         # Get TP/SL percentages from stored OCO info
-        if ticker not in self.oco_pairs:
+        oco = self.oco_pairs.get(ticker)
+        if oco is None:
             self.algo.debug(f"No OCO info for {ticker}")
             return
             
-        tp_pct = self.oco_pairs[ticker]['tp_pct']
-        sl_pct = self.oco_pairs[ticker]['sl_pct']
+        tp_pct = oco.tp_pct
+        sl_pct = oco.sl_pct
+        
+        # +1 long / -1 short: TP above and SL below entry for longs, mirrored for shorts
+        sign = 1 if direction == 'long' else -1
+        tp_price = self.round_to_tick(entry_price * (1 + sign * tp_pct), symbol)
+        sl_stop = self.round_to_tick(entry_price * (1 - sign * sl_pct), symbol)
+        exit_quantity = -sign * quantity
+        
+        # TP as limit order (want specific price)
+        tp_order = self.algo.limit_order(symbol, exit_quantity, tp_price)
+        
+        # SL as STOP-MARKET order (exit immediately when hit - no limit!)
+        sl_order = self.algo.stop_market_order(symbol, exit_quantity, sl_stop)
         
-        if direction == 'long':
-            # Long brackets
-            tp_price = self.round_to_tick(entry_price * (1 + tp_pct))
-            sl_stop = self.round_to_tick(entry_price * (1 - sl_pct))
-            
-            # TP as limit order (want specific price)
-            tp_order = self.algo.limit_order(symbol, -quantity, tp_price)
-            
-            # SL as STOP-MARKET order (exit immediately when hit - no limit!)
-            sl_order = self.algo.stop_market_order(symbol, -quantity, sl_stop)
-            
-        else:  # short
-            # Short brackets
-            tp_price = self.round_to_tick(entry_price * (1 - tp_pct))
-            sl_stop = self.round_to_tick(entry_price * (1 + sl_pct))
-            
-            # TP as limit order (want specific price)
-            tp_order = self.algo.limit_order(symbol, quantity, tp_price)
-            
-            # SL as STOP-MARKET order (exit immediately when hit - no limit!)
-            sl_order = self.algo.stop_market_order(symbol, quantity, sl_stop)
-            
         # Track brackets
-        self.position_brackets[ticker] = {
-            'tp': tp_order.order_id,
-            'sl': sl_order.order_id,
-            'entry_price': entry_price,
-            'direction': direction,
-            'sl_adjusted': False  # Track if SL has been adjusted to breakeven
-        }
+        self.position_brackets[ticker] = BracketSet(tp_order.order_id, sl_order.order_id, quantity)
         
         # Track order info
-        self.order_info[tp_order.order_id] = {
+        self._add_order(tp_order.order_id, {
             'ticker': ticker,
             'type': 'bracket_tp'
-        }
+        })
         
-        self.order_info[sl_order.order_id] = {
+        self._add_order(sl_order.order_id, {
             'ticker': ticker,
             'type': 'bracket_sl'
-        }
+        })
         
-        self.algo.debug(f"Brackets placed: TP@${tp_price:.2f}, SL@${sl_stop:.2f} (market)")
+        if self._verbose:
+            self.algo.debug(f"Brackets placed: TP@${tp_price:.2f}, SL@${sl_stop:.2f} (market)")
     
     def adjust_sl_to_breakeven(self, symbol, ticker, entry_price, direction):
         """
@@ -172,59 +237,42 @@ class OrderManager:
         brackets = self.position_brackets[ticker]
         
         # Check if already adjusted
-        if brackets.get('sl_adjusted', False):
+        if brackets.sl_adjusted:
             self.algo.debug(f"{ticker} SL already adjusted")
             return False
             
-        old_sl_id = brackets['sl']
+        old_sl_id = brackets.sl_id
         
-        # Get the breakeven offset from parameters
-        breakeven_offset = self.algo.parameters['breakeven_offset']
+        breakeven_offset = self._breakeven_offset
         
-        # Calculate new SL at breakeven + offset
-        if direction == 'long':
-            new_sl_stop = self.round_to_tick(entry_price * (1 + breakeven_offset))
-            
-            # Get current position quantity
-            quantity = abs(self.algo.portfolio[symbol].quantity)
-            if quantity <= 0:
-                self.algo.debug(f"No position found for {ticker}")
-                return False
-                
-            # Cancel old SL
-            self.algo.transactions.cancel_order(old_sl_id)
-            
-            # Place new SL as STOP-MARKET (exit immediately when hit)
-            new_sl = self.algo.stop_market_order(symbol, -quantity, new_sl_stop)
-            
-        else:  # short
-            new_sl_stop = self.round_to_tick(entry_price * (1 - breakeven_offset))
-            
-            # Get current position quantity
-            quantity = abs(self.algo.portfolio[symbol].quantity)
-            if quantity <= 0:
-                self.algo.debug(f"No position found for {ticker}")
-                return False
-                
-            # Cancel old SL
-            self.algo.transactions.cancel_order(old_sl_id)
+        # Bracketed quantity, cached when the entry filled
+        quantity = brackets.quantity
+        if quantity <= 0:
+            self.algo.debug(f"No position found for {ticker}")
+            return False
             
-            # Place new SL as STOP-MARKET (exit immediately when hit)
-            new_sl = self.algo.stop_market_order(symbol, quantity, new_sl_stop)
+        # Calculate new SL at breakeven + offset (in the position's favour)
+        sign = 1 if direction == 'long' else -1
+        new_sl_stop = self.round_to_tick(entry_price * (1 + sign * breakeven_offset), symbol)
+        
+        # Cancel old SL
+        self._safe_cancel(old_sl_id)
+        
+        # Place new SL as STOP-MARKET (exit immediately when hit)
+        new_sl = self.algo.stop_market_order(symbol, -sign * quantity, new_sl_stop)
         
         # Update tracking
-        brackets['sl'] = new_sl.order_id
-        brackets['sl_adjusted'] = True
+        brackets.sl_id = new_sl.order_id
+        brackets.sl_adjusted = True
         
         # Track the new order info
-        self.order_info[new_sl.order_id] = {
+        self._add_order(new_sl.order_id, {
             'ticker': ticker,
             'type': 'bracket_sl_adjusted'
-        }
+        })
         
         # Clean up old order info
-        if old_sl_id in self.order_info:
-            del self.order_info[old_sl_id]
+        self._remove_order(old_sl_id)
         
         self.algo.debug(f"{ticker} SL adjusted to breakeven+{breakeven_offset*100:.1f}%: ${new_sl_stop:.2f} (market)")
         return True
@@ -240,119 +288,111 @@ class OrderManager:
             return None
             
         order_data = self.order_info[order_id]
-        ticker = order_data['ticker']
-        order_type = order_data['type']
+        status = order_event.status
+        order_data['status'] = status  # Last seen status, read by _safe_cancel
         
-        if order_event.status == OrderStatus.FILLED:
-            
-            if order_type == 'oco_long':
-                # Long entry filled - cancel short OCO
-                if ticker in self.oco_pairs:
-                    short_id = self.oco_pairs[ticker]['short']
-                    try:
-                        self.algo.transactions.cancel_order(short_id)
-                    except:
-                        pass  # Already canceled
-                    
-                    # Place brackets
-                    self.place_bracket_orders(
-                        order_event.symbol,
-                        order_event.fill_price,
-                        'long',
-                        order_data['quantity']
-                    )
-                    
-                    # Cleanup OCO - check before deleting
-                    if ticker in self.oco_pairs:
-                        del self.oco_pairs[ticker]
-                    
-                return 'entry_long'
-                
-            elif order_type == 'oco_short':
-                # Short entry filled - cancel long OCO
-                if ticker in self.oco_pairs:
-                    long_id = self.oco_pairs[ticker]['long']
-                    try:
-                        self.algo.transactions.cancel_order(long_id)
-                    except:
-                        pass  # Already canceled
-                    
-                    # Place brackets
-                    self.place_bracket_orders(
-                        order_event.symbol,
-                        order_event.fill_price,
-                        'short',
-                        order_data['quantity']
-                    )
-                    
-                    # Cleanup OCO - check before deleting
-                    if ticker in self.oco_pairs:
-                        del self.oco_pairs[ticker]
-                    
-                return 'entry_short'
-                
-            elif order_type == 'bracket_tp':
-                # Take profit hit - cancel stop loss
-                if ticker in self.position_brackets:
-                    sl_id = self.position_brackets[ticker]['sl']
-                    try:
-                        self.algo.transactions.cancel_order(sl_id)
-                    except:
-                        pass  # Already canceled
-                    del self.position_brackets[ticker]
-                    
-                return 'exit_tp'
+        if status == OrderStatus.FILLED:
+            handler = self._fill_handlers.get(order_data['type'])
+            if handler:
+                return handler(order_event, order_data['ticker'], order_data)
                 
-            elif order_type == 'bracket_sl':
-                # Original stop loss hit - cancel take profit
-                if ticker in self.position_brackets:
-                    tp_id = self.position_brackets[ticker]['tp']
-                    try:
-                        self.algo.transactions.cancel_order(tp_id)
-                    except:
-                        pass  # Already canceled
-                    del self.position_brackets[ticker]
-                    
-                return 'exit_sl'
-                
-            elif order_type == 'bracket_sl_adjusted':
-                # Adjusted stop loss hit (breakeven) - cancel take profit
-                if ticker in self.position_brackets:
-                    tp_id = self.position_brackets[ticker]['tp']
-                    try:
-                        self.algo.transactions.cancel_order(tp_id)
-                    except:
-                        pass  # Already canceled
-                    del self.position_brackets[ticker]
-                    
-                return 'exit_sl_adjusted'
-                
-        elif order_event.status == OrderStatus.CANCELED:
+        elif status == OrderStatus.CANCELED:
             # Clean up canceled orders
-            if order_id in self.order_info:
-                del self.order_info[order_id]
+            self._remove_order(order_id)
                 
         return None
     
+    def _on_oco_long(self, order_event, ticker, order_data):
+        """Long entry filled - place brackets, cancel short OCO"""
+        self._on_oco_fill(order_event, ticker, order_data, 'long')
+        return 'entry_long'
+    
+    def _on_oco_short(self, order_event, ticker, order_data):
+        """Short entry filled - place brackets, cancel long OCO"""
+        self._on_oco_fill(order_event, ticker, order_data, 'short')
+        return 'entry_short'
+    
+    def _on_tp(self, order_event, ticker, order_data):
+        """Take profit hit - cancel stop loss"""
+        self._close_brackets(ticker, cancel_tp=False)
+        return 'exit_tp'
+    
+    def _on_sl(self, order_event, ticker, order_data):
+        """Original stop loss hit - cancel take profit"""
+        self._close_brackets(ticker, cancel_tp=True)
+        return 'exit_sl'
+    
+    def _on_sl_adjusted(self, order_event, ticker, order_data):
+        """Adjusted stop loss hit (breakeven) - cancel take profit"""
+        self._close_brackets(ticker, cancel_tp=True)
+        return 'exit_sl_adjusted'
+    
+    def _on_oco_fill(self, order_event, ticker, order_data, direction):
+        """Protect a filled entry with brackets, then cancel the other OCO leg."""
+        oco = self.oco_pairs.get(ticker)
+        if oco is not None:
+            # Brackets go out before the sibling cancel so the fill is never unprotected
+            self.place_bracket_orders(
+                order_event.symbol,
+                order_event.fill_price,
+                direction,
+                order_data['quantity']
+            )
+            
+            sibling_id = oco.short_id if direction == 'long' else oco.long_id
+            self._safe_cancel(sibling_id)
+            self._remove_order(sibling_id)  # Don't wait for the CANCELED event
+            
+            # Cleanup OCO
+            del self.oco_pairs[ticker]
+    
+    def _close_brackets(self, ticker, cancel_tp):
+        """One bracket leg filled - cancel the other and drop the bracket pair."""
+        brackets = self.position_brackets.pop(ticker, None)
+        if brackets is not None:
+            # The sibling stays tracked until its CANCELED event, so a fill that
+            # beats the cancel (a gap through both levels) still reaches main.py
+            self._safe_cancel(brackets.tp_id if cancel_tp else brackets.sl_id)
+    
+    def _add_order(self, order_id, info):
+        """Track an order in order_info and the per-ticker index."""
+        self.order_info[order_id] = info
+        self._orders_by_ticker[info['ticker']].add(order_id)
+    
+    def _remove_order(self, order_id):
+        """Stop tracking an order; unknown ids are ignored."""
+        info = self.order_info.pop(order_id, None)
+        if info is not None:
+            self._orders_by_ticker[info['ticker']].discard(order_id)
+    
+    def _safe_cancel(self, order_id):
+        """Cancel an order unless its last seen status is already terminal."""
+        info = self.order_info.get(order_id)
+        if info is not None:
+            if info.get('status') in TERMINAL_STATUSES:
+                return
+            info['status'] = OrderStatus.CANCELED
+        self.algo.transactions.cancel_order(order_id)
+    
     def cancel_oco_orders(self, ticker):
         """Cancel OCO orders for a ticker."""
         if ticker in self.oco_pairs:
             oco = self.oco_pairs[ticker]
-            try:
-                self.algo.transactions.cancel_order(oco['long'])
-            except:
-                pass  # Order might already be canceled
-            try:
-                self.algo.transactions.cancel_order(oco['short'])
-            except:
-                pass  # Order might already be canceled
+            self._safe_cancel(oco.long_id)
+            self._safe_cancel(oco.short_id)
             del self.oco_pairs[ticker]
-            self.algo.debug(f"Canceled OCO orders for {ticker}")
+            if self._verbose:
+                self.algo.debug(f"Canceled OCO orders for {ticker}")
     
     def has_pending_oco(self, ticker):
         """Check if ticker has pending OCO orders."""
         return ticker in self.oco_pairs
     
+    def is_bracket_order(self, order_id):
+        """Check if order_id is a tracked TP/SL bracket leg."""
+        info = self.order_info.get(order_id)
+        return info is not None and info['type'].startswith('bracket')
+    
     def cleanup_ticker(self, ticker):
         """Clean up all orders for a ticker (used when halting or time-stop)."""
         # Cancel OCO if exists
@@ -362,17 +402,10 @@ class OrderManager:
         # Cancel brackets if exist
         if ticker in self.position_brackets:
             brackets = self.position_brackets[ticker]
-            try:
-                self.algo.transactions.cancel_order(brackets['tp'])
-            except:
-                pass  # Order might already be canceled
-            try:
-                self.algo.transactions.cancel_order(brackets['sl'])
-            except:
-                pass  # Order might already be canceled
+            self._safe_cancel(brackets.tp_id)
+            self._safe_cancel(brackets.sl_id)
             del self.position_brackets[ticker]
             
-        # Clean up order info
-        orders_to_remove = [oid for oid, info in self.order_info.items() if info['ticker'] == ticker]
-        for oid in orders_to_remove:
-            del self.order_info[oid]
\ No newline at end of file
+        # Clean up order info - only this ticker's orders, via the reverse index
+        for oid in self._orders_by_ticker.pop(ticker, ()):
+            self.order_info.pop(oid, None)
\ No newline at end of file
@@ -10,25 +10,53 @@ class SignalGenerator:
     
     def __init__(self, params):
         self.params = params
-        self.long_offset = params['long_entry_offset']
-        self.short_offset = params['short_entry_offset']
-        self.tp_percentage = params['tp_percentage']
-        self.sl_percentage = params['sl_percentage']
+        self.long_offset = params.long_entry_offset
+        self.short_offset = params.short_entry_offset
+        self.tp_percentage = params.tp_percentage
+        self.sl_percentage = params.sl_percentage
+        self.position_size = params.position_size  # $ per position
+        
+        # Entry multipliers depend only on parameters - compute once
+        self.long_factor = 1.0 + self.long_offset
+        self.short_factor = 1.0 - self.short_offset
+        # Long stop above / short stop below the open holds for every positive
+        # open iff the factors straddle 1.0, so validate that once here
+        self.levels_valid = self.long_factor > 1.0 and self.short_factor < 1.0
+        
+        # Output buffers for generate_entry_levels, sized by reserve()
+        self.reserve(0)
     
-    def generate_entry_signals(self, ticker, open_price):
+    def reserve(self, n):
         """
-        Generate OCO entry signals based on opening price.
-        Returns dict with entry levels and parameters.
+        Size the generate_entry_levels output buffers for a universe of n
+        tickers, so the first market open does no allocation.
         """
-        if open_price <= 0:
-            return None
-            
-        # Calculate entry levels (raw, not rounded)
-        long_stop = open_price * (1 + self.long_offset)
-        short_stop = open_price * (1 - self.short_offset)
-        
-        # Validate signals
-        if long_stop <= open_price or short_stop >= open_price:
+        self._long_stops = np.empty(n)
+        self._short_stops = np.empty(n)
+        self._valid = np.empty(n, dtype=bool)
+    
+    def generate_entry_levels(self, opens):
+        """
+        Vectorized entry levels for a whole universe of opening prices.
+        Returns (long_stops, short_stops, valid) arrays aligned with opens;
+        valid marks the entries build_signals would accept. The arrays are
+        reused buffers, overwritten by the next call.
+        """
+        if self._valid.shape != opens.shape:
+            self.reserve(opens.shape[0])
+        np.multiply(opens, self.long_factor, out=self._long_stops)
+        np.multiply(opens, self.short_factor, out=self._short_stops)
+        if self.levels_valid:
+            np.greater(opens, 0, out=self._valid)
+        else:
+            self._valid.fill(False)
+        return self._long_stops, self._short_stops, self._valid
+    
+    def build_signals(self, ticker, open_price, long_stop, short_stop):
+        """
+        Validate precomputed entry levels and package them as a signal dict.
+        """
+        if open_price <= 0 or not self.levels_valid:
             return None
             
         return {
@@ -36,6 +64,8 @@ class SignalGenerator:
             'open_price': open_price,
             'long_stop': long_stop,  # Rounding happens in OrderManager
             'short_stop': short_stop,
+            'long_quantity': int(self.position_size / long_stop),
+            'short_quantity': int(self.position_size / short_stop),
             'tp_percentage': self.tp_percentage,
             'sl_percentage': self.sl_percentage
         }
\ No newline at end of file
@@ -1,129 +1,222 @@
 # region imports
 from AlgorithmImports import *
 # endregion
+import csv
+import os
+
+# Sign of a side's exposure: PnL % is sign * (exit - entry) / entry
+SIDE_SIGNS = {'long': 1.0, 'short': -1.0}
+
+# Fill direction labels for FILL log lines; anything not a buy logs as SELL
+DIRECTION_NAMES = {OrderDirection.BUY: "BUY", OrderDirection.SELL: "SELL"}
+
+# Exit reasons recorded as manual-intervention overrides; "OVERRIDE" is the legacy spelling
+OVERRIDE_REASONS = frozenset(("ManualIntervention", "OVERRIDE"))
 
 class TradeLogger:
     """
     Handles logging and trade recording.
+    In backtests INFO lines are buffered and emitted as one debug message per
+    flush; live runs emit every line immediately.
     """
     
+    FLUSH_THRESHOLD = 64  # Buffered INFO lines that force a flush
+    
     def __init__(self, algorithm):
         self.algo = algorithm
-        self.trades = []
-        self.daily_pnl = 0
+        # Trade history as columns: object fields in lists, numeric fields in
+        # float arrays grown by doubling; the first trade_count rows are filled
+        self.trades = {
+            'date': [],
+            'ticker': [],
+            'side': [],
+            'exit_reason': [],
+            'entry_price': np.empty(256),
+            'exit_price': np.empty(256),
+            'pnl': np.empty(256),
+            'pnl_pct': np.empty(256)
+        }
+        self.trade_count = 0
+        
+        # Optional trade CSV stream, opened by open_trade_csv
+        self._csv_file = None
+        self._csv_writer = None
+        self._stamp_time = None  # algo.time the cached timestamp text was built for
+        self._stamp_text = ""
+        self._log_buffer = []
+        # Live logs must stay timely and in order with main.py's own debug lines
+        self._flush_threshold = 1 if algorithm.live_mode else self.FLUSH_THRESHOLD
+        # INFO lines are skipped entirely (never formatted) when disabled; warnings and errors always log
+        self._log_enabled = algorithm.live_mode or algorithm._trade_logging
+        
+        # Order status -> log handler; other statuses (e.g. expected OCO cancels) are silent
+        self._order_event_handlers = {
+            OrderStatus.FILLED: self._log_fill,
+            OrderStatus.INVALID: self._log_invalid
+        }
+        
+        # Running aggregates for the day in _today_key, updated by log_trade
+        # and reset in place when the day rolls over
+        self._today_key = None
+        self._today = {'pnl': 0.0, 'wins': 0, 'losses': 0, 'trades': 0, 'exit_reasons': {}, 'overrides': []}
         
     def log_event(self, message, level="INFO"):
         """Log events with timestamp"""
-        timestamp = self.algo.time.strftime("%Y-%m-%d %H:%M:%S")
-        self.algo.debug(f"[{timestamp}] [{level}] {message}")
+        if level == "INFO" and not self._log_enabled:
+            return
+        self._log_buffer.append(f"[{self._timestamp(self.algo.time)}] [{level}] {message}")
+        # Warnings and errors go out immediately, after anything queued before them
+        if level != "INFO" or len(self._log_buffer) >= self._flush_threshold:
+            self.flush()
+    
+    def _timestamp(self, now):
+        """Log timestamp text; events within one time slice share it, so format it once"""
+        if now != self._stamp_time:
+            # Same text as strftime("%Y-%m-%d %H:%M:%S") for the naive algo.time, without format parsing
+            self._stamp_text = now.isoformat(" ", "seconds")
+            self._stamp_time = now
+        return self._stamp_text
+    
+    def flush(self):
+        """Emit buffered log lines as a single debug message"""
+        if self._log_buffer:
+            self.algo.debug("\n".join(self._log_buffer))
+            self._log_buffer.clear()
     
     def log_order_event(self, order_event):
-        """Log order events using proper enum comparison"""
-        # Only log important events to reduce noise
-        if order_event.status == OrderStatus.FILLED:
-            direction = "BUY" if order_event.direction == OrderDirection.BUY else "SELL"
-            self.log_event(
-                f"FILL: {order_event.symbol} {direction} "
-                f"{abs(order_event.fill_quantity)} @ ${order_event.fill_price:.2f}",
-                "INFO"
-            )
-        elif order_event.status == OrderStatus.CANCELED:
-            # Silent cancellation (expected for OCO)
-            pass
-        elif order_event.status == OrderStatus.INVALID:
-            self.log_event(f"Invalid order: {order_event.symbol}", "ERROR")
+        """Log important order events; everything else is dropped to reduce noise"""
+        handler = self._order_event_handlers.get(order_event.status)
+        if handler:
+            handler(order_event)
+    
+    def _log_fill(self, order_event):
+        """Filled order - log side, size and price"""
+        if not self._log_enabled:
+            return
+        direction = DIRECTION_NAMES.get(order_event.direction, "SELL")
+        self.log_event(
+            f"FILL: {order_event.symbol} {direction} "
+            f"{abs(order_event.fill_quantity)} @ ${order_event.fill_price:.2f}",
+            "INFO"
+        )
+    
+    def _log_invalid(self, order_event):
+        """Rejected order - log as an error"""
+        self.log_event(f"Invalid order: {order_event.symbol}", "ERROR")
             
     def log_trade(self, ticker, side, entry, exit, pnl, exit_reason):
         """Log completed trade"""
+        now = self.algo.time
+        pnl_pct = 0
+        
+        is_override = exit_reason in OVERRIDE_REASONS
+        
         # Handle special cases
-        if exit_reason == "ManualIntervention":
-            trade = {
-                'date': self.algo.time,
-                'ticker': ticker,
-                'side': 'OVERRIDE',
-                'entry_price': 0,
-                'exit_price': 0,
-                'pnl': 0,
-                'pnl_pct': 0,
-                'exit_reason': 'ManualIntervention'
-            }
-        elif exit_reason == "OVERRIDE":  # Legacy compatibility
-            trade = {
-                'date': self.algo.time,
-                'ticker': ticker,
-                'side': 'OVERRIDE',
-                'entry_price': 0,
-                'exit_price': 0,
-                'pnl': 0,
-                'pnl_pct': 0,
-                'exit_reason': 'ManualIntervention'
-            }
+        if is_override:
+            self._append_trade(now, ticker, 'OVERRIDE', 0, 0, 0, 0, 'ManualIntervention')
         else:
             # Normal trade
-            pnl_pct = 0
             if entry > 0:
-                if side == 'long':
-                    pnl_pct = ((exit - entry) / entry * 100)
-                else:  # short
-                    pnl_pct = ((entry - exit) / entry * 100)
+                pnl_pct = SIDE_SIGNS[side] * (exit - entry) / entry * 100
                     
-            trade = {
-                'date': self.algo.time,
-                'ticker': ticker,
-                'side': side,
-                'entry_price': entry,
-                'exit_price': exit,
-                'pnl': pnl,
-                'pnl_pct': pnl_pct,
-                'exit_reason': exit_reason
-            }
+            self._append_trade(now, ticker, side, entry, exit, pnl, pnl_pct, exit_reason)
             
-        self.trades.append(trade)
+        today = self._today
+        day = now.date()
+        if day != self._today_key:
+            self._today_key = day
+            today['pnl'] = 0.0
+            today['wins'] = today['losses'] = today['trades'] = 0
+            today['exit_reasons'].clear()
+            today['overrides'].clear()
         
-        # Only add to daily PnL for real trades
-        if exit_reason not in ["ManualIntervention", "OVERRIDE"]:
-            self.daily_pnl += pnl
+        # Only real trades count towards the daily aggregates
+        if not is_override:
+            today['trades'] += 1
+            today['pnl'] += pnl
+            if pnl > 0:
+                today['wins'] += 1
+            else:
+                today['losses'] += 1
+            exit_reasons = today['exit_reasons']
+            exit_reasons[exit_reason] = exit_reasons.get(exit_reason, 0) + 1
             
-            self.log_event(
-                f"TRADE: {ticker} {side} entry=${entry:.2f} exit=${exit:.2f} "
-                f"pnl=${pnl:.2f} ({trade['pnl_pct']:+.2f}%) reason={exit_reason}",
-                "INFO"
-            )
+            # Full INFO line composed in one format, straight into the buffer
+            if self._log_enabled:
+                buffer = self._log_buffer
+                buffer.append(
+                    f"[{self._timestamp(now)}] [INFO] TRADE: {ticker} {side} entry=${entry:.2f} exit=${exit:.2f} "
+                    f"pnl=${pnl:.2f} ({pnl_pct:+.2f}%) reason={exit_reason}"
+                )
+                if len(buffer) >= self._flush_threshold:
+                    self.flush()
         else:
+            today['overrides'].append(ticker)
             self.log_event(
                 f"OVERRIDE: {ticker} position manually intervened - halting ticker",
                 "WARNING"
             )
     
+    def _append_trade(self, date, ticker, side, entry_price, exit_price, pnl, pnl_pct, exit_reason):
+        """Append one row to the columnar trade history"""
+        cols = self.trades
+        n = self.trade_count
+        if n == len(cols['pnl']):
+            for name in ('entry_price', 'exit_price', 'pnl', 'pnl_pct'):
+                cols[name] = np.concatenate((cols[name], np.empty(n)))
+        cols['date'].append(date)
+        cols['ticker'].append(ticker)
+        cols['side'].append(side)
+        cols['exit_reason'].append(exit_reason)
+        cols['entry_price'][n] = entry_price
+        cols['exit_price'][n] = exit_price
+        cols['pnl'][n] = pnl
+        cols['pnl_pct'][n] = pnl_pct
+        self.trade_count = n + 1
+        if self._csv_writer is not None:
+            self._csv_writer.writerow((date.isoformat(), ticker, side, entry_price, exit_price, pnl, pnl_pct, exit_reason))
+    
+    def open_trade_csv(self, path):
+        """
+        Write every recorded trade to a CSV file at path; flushed with each daily summary.
+        Backtests start the file afresh since the ObjectStore outlives a run; live
+        runs append so the trail survives restarts.
+        """
+        append = self.algo.live_mode
+        is_new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self._csv_file = open(path, "a" if append else "w", newline="", buffering=64 * 1024)
+        self._csv_writer = csv.writer(self._csv_file)
+        if is_new:
+            self._csv_writer.writerow(('date', 'ticker', 'side', 'entry_price', 'exit_price', 'pnl', 'pnl_pct', 'exit_reason'))
+    
+    def close_trade_csv(self):
+        """Flush and close the trade CSV, if one is open"""
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv_writer = None
+    
     def daily_summary(self, date):
-        """Log daily summary"""
-        if self.trades:
-            today_trades = [t for t in self.trades if t['date'].date() == date.date() and t['exit_reason'] not in ["ManualIntervention", "OVERRIDE"]]
-            if today_trades:
-                total_pnl = sum(t['pnl'] for t in today_trades)
-                win_count = sum(1 for t in today_trades if t['pnl'] > 0)
-                loss_count = sum(1 for t in today_trades if t['pnl'] <= 0)
-                
-                # Count exit reasons
-                exit_reasons = {}
-                for t in today_trades:
-                    reason = t['exit_reason']
-                    exit_reasons[reason] = exit_reasons.get(reason, 0) + 1
-                
-                reason_summary = ", ".join([f"{reason}: {count}" for reason, count in exit_reasons.items()])
+        """Log daily summary from the running aggregates kept by log_trade"""
+        if self._today_key == date.date():
+            today = self._today
+            if today['trades'] and self._log_enabled:
+                reason_summary = ", ".join([f"{reason}: {count}" for reason, count in today['exit_reasons'].items()])
                 
                 self.log_event(
-                    f"Daily Summary: {len(today_trades)} trades, "
-                    f"W/L: {win_count}/{loss_count}, PnL: ${total_pnl:.2f}, "
+                    f"Daily Summary: {today['trades']} trades, "
+                    f"W/L: {today['wins']}/{today['losses']}, PnL: ${today['pnl']:.2f}, "
                     f"Exits: {reason_summary}",
                     "INFO"
                 )
                 
             # Log any overrides
-            overrides = [t for t in self.trades if t['date'].date() == date.date() and t['exit_reason'] in ["ManualIntervention", "OVERRIDE"]]
-            if overrides:
-                override_tickers = [t['ticker'] for t in overrides]
+            if today['overrides']:
                 self.log_event(
-                    f"Manual interventions detected: {', '.join(override_tickers)}",
+                    f"Manual interventions detected: {', '.join(today['overrides'])}",
                     "WARNING"
-                )
\ No newline at end of file
+                )
+                
+        self.flush()
+        if self._csv_file is not None:
+            self._csv_file.flush()
\ No newline at end of file